@@ -1,65 +1,326 @@
+from collections import deque
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional; without it the kernels below run as plain Python
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True)
+def _bfs_csr(indptr, indices, cap, source, sink, parent, visited):
+    # parent[v] is the CSR edge used to reach v
+    queue = np.empty(len(visited), dtype=np.int32)
+    visited[:] = False
+    visited[source] = True
+    queue[0] = source
+    head, tail = 0, 1
+
+    while head < tail:
+        u = queue[head]
+        head += 1
+        for e in range(indptr[u], indptr[u + 1]):
+            v = indices[e]
+            if not visited[v] and cap[e] > 0:
+                visited[v] = True
+                parent[v] = e
+                queue[tail] = v
+                tail += 1
+
+    return visited[sink]
+
+
+@njit(cache=True)
+def _trace_path(indices, rev, parent, source, sink, edges):
+    # Fill edges with the sink -> source chain of parent edges
+    depth = 0
+    v = sink
+    while v != source:
+        e = parent[v]
+        edges[depth] = e
+        depth += 1
+        v = indices[rev[e]]
+    return depth
+
+
+@njit(cache=True)
+def _level_bfs(indptr, indices, cap, source, level):
+    queue = np.empty(len(level), dtype=np.int32)
+    level[:] = -1
+    level[source] = 0
+    queue[0] = source
+    head, tail = 0, 1
+
+    while head < tail:
+        u = queue[head]
+        head += 1
+        for e in range(indptr[u], indptr[u + 1]):
+            v = indices[e]
+            if cap[e] > 0 and level[v] < 0:
+                level[v] = level[u] + 1
+                queue[tail] = v
+                tail += 1
+
+    return level
+
+
+@njit(cache=True)
+def _dinic_dfs(indptr, indices, cap, rev, current_arc, level, source, sink, path):
+    depth = 0
+    u = source
+
+    while u != sink:
+        e = current_arc[u]
+        end = indptr[u + 1]
+        while e < end and not (cap[e] > 0 and level[indices[e]] == level[u] + 1):
+            e += 1
+        current_arc[u] = e
+
+        if e < end:
+            path[depth] = e
+            depth += 1
+            u = indices[e]
+        elif u == source:
+            return 0
+        else:
+            # Dead end: drop u from the level graph and retreat one edge
+            level[u] = -1
+            depth -= 1
+            u = indices[rev[path[depth]]]
+
+    path_flow = cap[path[0]]
+    for i in range(1, depth):
+        path_flow = min(path_flow, cap[path[i]])
+    for i in range(depth):
+        cap[path[i]] -= path_flow
+        cap[rev[path[i]]] += path_flow
+    return path_flow
+
+
 class Graph:
     def __init__(self, size):
-        self.adj_matrix = [[0] * size for _ in range(size)]
         self.size = size
         self.vertex_data = [''] * size
+        self.edge_keys = []
+        self.edge_caps = []
+        self.edge_sets = []
+        self.indptr = None
 
     def add_edge(self, u, v, capacity):
-        self.adj_matrix[u][v] = capacity
+        # Sets the u -> v capacity, replacing whatever was added before
+        self._add_edge_block([u], [v], [capacity], replace=True)
+
+    def add_edges(self, us, vs, capacities):
+        # Parallel (u, v) edges add up, both within the batch and onto
+        # capacity already on the edge
+        self._add_edge_block(us, vs, capacities, replace=False)
+
+    def _add_edge_block(self, us, vs, capacities, replace):
+        us = np.asarray(us, dtype=np.int64)
+        vs = np.asarray(vs, dtype=np.int64)
+        if ((us < 0) | (us >= self.size) | (vs < 0) | (vs >= self.size)).any():
+            raise ValueError(f"edge endpoints must be vertices in [0, {self.size})")
+        self.edge_keys.append(us * self.size + vs)
+        self.edge_caps.append(np.asarray(capacities, dtype=np.int64))
+        self.edge_sets.append(np.full(len(us), replace, dtype=np.bool_))
+        self.indptr = None
 
     def add_vertex_data(self, vertex, data):
         if 0 <= vertex < self.size:
             self.vertex_data[vertex] = data
 
-    def bfs(self, source, sink, parent):
-        visited = [False] * self.size
-        queue = []
-        queue.append(source)
-        visited[source] = True
+    def build_csr(self):
+        keys = np.concatenate(self.edge_keys) if self.edge_keys else np.empty(0, dtype=np.int64)
+        caps = np.concatenate(self.edge_caps) if self.edge_caps else np.empty(0, dtype=np.int64)
+        sets = np.concatenate(self.edge_sets) if self.edge_sets else np.empty(0, dtype=np.bool_)
 
-        while queue:
-            u  = queue.pop(0)
+        # Each (u, v) keeps its last add_edge capacity plus everything
+        # add_edges put on it afterwards
+        keys, inverse = np.unique(keys, return_inverse=True)
+        arrival = np.arange(len(caps))
+        last_set = np.full(len(keys), -1, dtype=np.int64)
+        np.maximum.at(last_set, inverse[sets], arrival[sets])
+        live = arrival >= last_set[inverse]
+        summed = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(summed, inverse[live], caps[live])
+        caps = summed
+        keep = caps > 0
+        us, vs = np.divmod(keys[keep], self.size)
+        cs = caps[keep]
+
+        # Every edge gets a zero-capacity reverse twin; rev[e] is e's twin
+        m = len(us)
+        src = np.concatenate([us, vs])
+        dst = np.concatenate([vs, us])
+        cap = np.concatenate([cs, np.zeros(m, dtype=np.int64)])
+        twin = np.concatenate([np.arange(m, 2 * m), np.arange(m)])
+
+        order = np.lexsort((dst, src))
+        position = np.empty(2 * m, dtype=np.int64)
+        position[order] = np.arange(2 * m)
 
-            for ind, val in enumerate(self.adj_matrix[u]):
-                if not visited[ind] and val > 0:
-                    queue.append(ind)
-                    visited[ind] = True
-                    parent[ind] = u
+        # int32 halves the bytes the kernels stream; capacities only widen
+        # to int64 when a single edge would not fit
+        cap_dtype = np.int32 if cs.max(initial=0) <= np.iinfo(np.int32).max else np.int64
+        self.indptr = np.zeros(self.size + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src, minlength=self.size), out=self.indptr[1:])
+        self.indices = dst[order].astype(np.int32)
+        self.base_cap = cap[order].astype(cap_dtype)
+        self.cap = self.base_cap.copy()
+        self.rev = position[twin[order]].astype(np.int32)
+
+    def reset_residual(self):
+        # Each flow run starts from a fresh copy of the original capacities
+        if self.indptr is None:
+            self.build_csr()
+        self.cap = self.base_cap.copy()
+
+    def bfs(self, source, sink, parent_edge):
+        # Fills parent_edge[v] with the CSR edge index used to reach v (not
+        # the parent vertex; that is indices[rev[parent_edge[v]]])
+        if self.indptr is None:
+            self.build_csr()
+        visited = np.zeros(self.size, dtype=np.bool_)
+        return _bfs_csr(self.indptr, self.indices, self.cap, source, sink, parent_edge, visited)
 
-        return visited[sink]
-    
     def edmonds_karp(self, source, sink):
-        parent = [-1] * self.size
+        if source == sink:
+            raise ValueError("source and sink must be different vertices")
+        self.reset_residual()
+        parent_edge = np.full(self.size, -1, dtype=np.int32)
+        edges = np.empty(self.size, dtype=np.int32)
         max_flow = 0
 
-        while self.bfs(source, sink, parent):
-            path_flow = float('Inf')
-            s = sink
-
-            while s != source:
-                path_flow = min(path_flow, self.adj_matrix[parent[s]][s])
-                s = parent[s]
-
-            max_flow += path_flow
-            v = sink
-            while v != source:
-                u = parent[v]
-                self.adj_matrix[u][v] -= path_flow
-                self.adj_matrix[v][u] += path_flow
-                v = parent[v]
-
-            path = []
-            v = sink
-            while v != source:
-                path.append(v)
-                v = parent[v]
-            path.append(source)
-            path.reverse()
+        while self.bfs(source, sink, parent_edge):
+            depth = _trace_path(self.indices, self.rev, parent_edge, source, sink, edges)
+            path_edges = edges[depth - 1::-1]
+            path_flow = self.cap[path_edges].min()
+
+            max_flow += int(path_flow)
+            self.cap[path_edges] -= path_flow
+            self.cap[self.rev[path_edges]] += path_flow
+
+            path = [source] + self.indices[path_edges].tolist()
             path_names = [self.vertex_data[node] for node in path]
             print ("path: ", " -> ".join(path_names), ", flow: ", path_flow)
 
         return max_flow
-      
+
+    def dinic(self, source, sink):
+        if source == sink:
+            raise ValueError("source and sink must be different vertices")
+        self.reset_residual()
+        level = np.empty(self.size, dtype=np.int32)
+        path = np.empty(self.size, dtype=np.int32)
+        max_flow = 0
+
+        while _level_bfs(self.indptr, self.indices, self.cap, source, level)[sink] >= 0:
+            current_arc = self.indptr[:-1].copy()
+            while True:
+                path_flow = _dinic_dfs(self.indptr, self.indices, self.cap, self.rev,
+                                       current_arc, level, source, sink, path)
+                if path_flow == 0:
+                    break
+                max_flow += int(path_flow)
+
+        return max_flow
+
+    def global_relabel(self, source, sink):
+        # Exact residual distance to the sink, or n + distance to the source
+        # for vertices that can no longer reach the sink
+        n = self.size
+        height = np.full(n, 2 * n, dtype=np.int32)
+
+        for root, base in ((sink, 0), (source, n)):
+            height[root] = base
+            queue = deque([root])
+            while queue:
+                v = queue.popleft()
+                for e in range(self.indptr[v], self.indptr[v + 1]):
+                    w = self.indices[e]
+                    if self.cap[self.rev[e]] > 0 and height[w] == 2 * n:
+                        height[w] = height[v] + 1
+                        queue.append(w)
+
+        return height
+
+    def push_relabel(self, source, sink):
+        if source == sink:
+            raise ValueError("source and sink must be different vertices")
+        self.reset_residual()
+        n = self.size
+        indptr, indices, cap, rev = self.indptr, self.indices, self.cap, self.rev
+        excess = np.zeros(n, dtype=np.int64)
+        active = np.zeros(n, dtype=np.bool_)
+        queue = deque()
+
+        for e in range(indptr[source], indptr[source + 1]):
+            v = indices[e]
+            if cap[e] > 0:
+                excess[v] += cap[e]
+                excess[source] -= cap[e]
+                cap[rev[e]] += cap[e]
+                cap[e] = 0
+                if v != sink and not active[v]:
+                    active[v] = True
+                    queue.append(v)
+
+        height = self.global_relabel(source, sink)
+        count = np.bincount(height, minlength=2 * n + 1)
+        current_arc = indptr[:-1].copy()
+        relabels = 0
+
+        while queue:
+            u = queue.popleft()
+            active[u] = False
+
+            while excess[u] > 0:
+                e = current_arc[u]
+
+                if e == indptr[u + 1]:
+                    old = height[u]
+                    out = np.arange(indptr[u], indptr[u + 1])
+                    residual = out[cap[out] > 0]
+                    height[u] = height[indices[residual]].min() + 1
+                    count[old] -= 1
+                    count[height[u]] += 1
+                    current_arc[u] = indptr[u]
+                    relabels += 1
+
+                    # Gap: nothing left at height old, so nothing above it
+                    # (and below n) can reach the sink any more
+                    if count[old] == 0 and old < n:
+                        gap = (height > old) & (height < n)
+                        height[gap] = n + 1
+                        count = np.bincount(height, minlength=2 * n + 1)
+                    continue
+
+                v = indices[e]
+                if cap[e] > 0 and height[u] == height[v] + 1:
+                    delta = min(excess[u], cap[e])
+                    cap[e] -= delta
+                    cap[rev[e]] += delta
+                    excess[u] -= delta
+                    excess[v] += delta
+                    if v != source and v != sink and not active[v]:
+                        active[v] = True
+                        queue.append(v)
+                else:
+                    current_arc[u] = e + 1
+
+            if relabels >= n:
+                height = self.global_relabel(source, sink)
+                count = np.bincount(height, minlength=2 * n + 1)
+                current_arc = indptr[:-1].copy()
+                relabels = 0
+
+        return int(excess[sink])
+
 
 # Example usage:
 
@@ -68,17 +329,21 @@ vertex_names = ['s', 'v1', 'v2', 'v3', 'v4', 't']
 for i, name in enumerate(vertex_names):
     g.add_vertex_data(i, name)
 
-g.add_edge(0, 1, 3)  # s  -> v1, cap: 3
-g.add_edge(0, 2, 7)  # s  -> v2, cap: 7
-g.add_edge(1, 3, 3)  # v1 -> v3, cap: 3
-g.add_edge(1, 4, 4)  # v1 -> v4, cap: 4
-g.add_edge(2, 1, 5)  # v2 -> v1, cap: 5
-g.add_edge(2, 4, 3)  # v2 -> v4, cap: 3
-g.add_edge(3, 4, 3)  # v3 -> v4, cap: 3
-g.add_edge(3, 5, 2)  # v3 -> t,  cap: 2
-g.add_edge(4, 5, 6)  # v4 -> t,  cap: 6
+edges = [
+    (0, 1, 3),  # s  -> v1, cap: 3
+    (0, 2, 7),  # s  -> v2, cap: 7
+    (1, 3, 3),  # v1 -> v3, cap: 3
+    (1, 4, 4),  # v1 -> v4, cap: 4
+    (2, 1, 5),  # v2 -> v1, cap: 5
+    (2, 4, 3),  # v2 -> v4, cap: 3
+    (3, 4, 3),  # v3 -> v4, cap: 3
+    (3, 5, 2),  # v3 -> t,  cap: 2
+    (4, 5, 6),  # v4 -> t,  cap: 6
+]
+us, vs, capacities = zip(*edges)
+g.add_edges(us, vs, capacities)
 
 source = 0
 sink = 5
 
-print("The maximum possible flow is:", g.edmonds_karp(source, sink))
+print("The maximum possible flow is:", g.dinic(source, sink))
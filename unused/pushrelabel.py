@@ -1,8 +1,54 @@
+import numpy as np
 import pandas as pd
 import networkx as nx
-from networkx.algorithms.flow import maximum_flow
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import maximum_flow
+from concurrent.futures import ProcessPoolExecutor
+import os
 import time
 
+# Capacity matrix shared by every pair handled in one worker process
+_worker_capacity = None
+
+
+def _init_flow_worker(capacity_matrix):
+    """Receive the capacity matrix once per worker instead of once per pair"""
+    global _worker_capacity
+    _worker_capacity = capacity_matrix
+
+
+def _top_k(values, k):
+    """
+    Indices of the k largest values, highest first
+    
+    Selects in O(n) with np.partition and only sorts the k winners; ties
+    keep index order, exactly like sorted(..., reverse=True)[:k]
+    """
+    k = min(k, len(values))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    
+    kth = -np.partition(-values, k - 1)[k - 1]
+    above = np.flatnonzero(values > kth)
+    ties = np.flatnonzero(values == kth)[:k - len(above)]
+    top = np.concatenate([above, ties])
+    return top[np.argsort(-values[top], kind='stable')]
+
+
+def _max_flow_value(capacity_matrix, source, sink):
+    """Max flow value between two stop indices, or None if it fails"""
+    try:
+        return int(maximum_flow(capacity_matrix, source, sink, method='dinic').flow_value)
+    except ValueError:
+        return None
+
+
+def _pair_max_flow(pair):
+    """Worker task: max flow for one (source, sink) index pair"""
+    source, sink = pair
+    return source, sink, _max_flow_value(_worker_capacity, source, sink)
+
+
 class TransjakartaMaxFlowAnalyzer:
     """
     Analyzes Transjakarta transit network using Maximum Flow algorithm
@@ -20,6 +66,12 @@ class TransjakartaMaxFlowAnalyzer:
         self.trips = pd.read_csv(f'{gtfs_path}trips.txt')
         self.routes = pd.read_csv(f'{gtfs_path}routes.txt')
         self.network = None
+        self.edges = None
+        self.stop_ids = None
+        self.in_degree = None
+        self.out_degree = None
+        self.degree = None
+        self.capacity_matrix = None
         
         print(f"✓ Loaded {len(self.stops)} stops")
         print(f"✓ Loaded {len(self.stop_times)} stop times")
@@ -45,54 +97,101 @@ class TransjakartaMaxFlowAnalyzer:
         print("\nBuilding transit network graph...")
         self.network = nx.DiGraph()
         
-        # Add all stops as nodes
-        for _, stop in self.stops.iterrows():
-            self.network.add_node(
-                stop['stop_id'],
-                stop_name=stop.get('stop_name', ''),
-                lat=stop.get('stop_lat', 0),
-                lon=stop.get('stop_lon', 0)
-            )
-        
-        # Group stop_times by trip to get sequential connections
-        trips_data = self.stop_times.groupby('trip_id')
-        edge_count = 0
+        # Add all stops as nodes; optional columns missing from stops.txt
+        # fall back to the same defaults as before
+        defaults = {'stop_name': '', 'stop_lat': 0, 'stop_lon': 0}
+        stops = self.stops.assign(
+            **{col: value for col, value in defaults.items() if col not in self.stops.columns}
+        )
+        ids = stops['stop_id'].to_numpy()
+        names = stops['stop_name'].to_numpy()
+        lats = stops['stop_lat'].to_numpy()
+        lons = stops['stop_lon'].to_numpy()
+        self.network.add_nodes_from(
+            (stop_id, {'stop_name': name, 'lat': lat, 'lon': lon})
+            for stop_id, name, lat, lon in zip(ids, names, lats, lons)
+        )
         
-        for trip_id, trip_stops in trips_data:
-            # Sort by stop_sequence to maintain order
-            stops_list = trip_stops.sort_values('stop_sequence')
-            
-            # Connect consecutive stops in the trip
-            for i in range(len(stops_list) - 1):
-                source = stops_list.iloc[i]['stop_id']
-                target = stops_list.iloc[i + 1]['stop_id']
-                
-                # Add or update edge with capacity
-                if self.network.has_edge(source, target):
-                    # Multiple trips use same edge -> increase capacity
-                    self.network[source][target]['capacity'] += default_capacity
-                    self.network[source][target]['trip_count'] += 1
-                else:
-                    self.network.add_edge(
-                        source, 
-                        target, 
-                        capacity=default_capacity,
-                        trip_count=1,
-                        weight=1  # Can be updated with distance/time
-                    )
-                    edge_count += 1
+        # Sort once by trip and sequence, then pair each stop with the next
+        # stop of the same trip (the last stop of every trip has none)
+        stop_times = self.stop_times.sort_values(['trip_id', 'stop_sequence'])
+        
+        # Trip ids reused across routes repeat stop_sequence values; order
+        # those trips with the same per-trip sort_values('stop_sequence') as
+        # before so their stops pair up exactly as they always have
+        tied = stop_times.duplicated(['trip_id', 'stop_sequence'], keep=False)
+        if tied.any():
+            reused_ids = stop_times.loc[tied, 'trip_id'].unique()
+            reused_trips = self.stop_times[self.stop_times['trip_id'].isin(reused_ids)]
+            stop_times = pd.concat(
+                [stop_times[~stop_times['trip_id'].isin(reused_ids)]]
+                + [trip.sort_values('stop_sequence') for _, trip in reused_trips.groupby('trip_id')]
+            ).sort_values('trip_id', kind='stable')
+        
+        stop_times = stop_times.assign(
+            next_stop=stop_times.groupby('trip_id')['stop_id'].shift(-1)
+        ).dropna(subset=['next_stop'])
+        
+        # Multiple trips use same edge -> increase capacity
+        edges = (
+            stop_times.groupby(['stop_id', 'next_stop'], sort=False)
+            .size()
+            .rename('trip_count')
+            .reset_index()
+        )
+        edges['capacity'] = edges['trip_count'].astype('int64') * default_capacity
+        
+        edges['weight'] = 1  # Can be updated with distance/time
+        self.network.add_edges_from(zip(
+            edges['stop_id'],
+            edges['next_stop'],
+            edges[['capacity', 'trip_count', 'weight']].to_dict('records')
+        ))
+        
+        # Integer stop indices for array-based analysis: stops.txt order,
+        # then any stop_times ids missing from stops.txt, so the indices
+        # cover exactly the nodes of the networkx graph
+        self.stop_ids = pd.Index(
+            pd.concat([self.stops['stop_id'], self.stop_times['stop_id']]).drop_duplicates()
+        )
+        edges['u'] = pd.Categorical(edges['stop_id'], categories=self.stop_ids).codes.astype(np.int32)
+        edges['v'] = pd.Categorical(edges['next_stop'], categories=self.stop_ids).codes.astype(np.int32)
+        self.edges = edges
+        
+        # In/out/total degree per stop index, counted once from the edges
+        num_stops = len(self.stop_ids)
+        self.out_degree = np.bincount(edges['u'], minlength=num_stops)
+        self.in_degree = np.bincount(edges['v'], minlength=num_stops)
+        self.degree = self.in_degree + self.out_degree
+        
+        # CSR capacity matrix over those indices, used for every flow query;
+        # scipy's maximum_flow only takes int32, so refuse rather than wrap
+        # when trip_count * default_capacity outgrows it
+        capacities = self.edges['capacity'].to_numpy()
+        if capacities.max(initial=0) > np.iinfo(np.int32).max:
+            raise ValueError(
+                f"Edge capacity {capacities.max():,} exceeds the int32 limit of maximum_flow"
+            )
+        self.capacity_matrix = csr_matrix(
+            (capacities.astype(np.int32), (self.edges['u'], self.edges['v'])),
+            shape=(num_stops, num_stops)
+        )
         
         print(f"✓ Built network: {self.network.number_of_nodes()} nodes, {self.network.number_of_edges()} edges")
         
         # Calculate and display additional network info
-        degrees = dict(self.network.degree())
-        avg_degree = sum(degrees.values()) / len(degrees) if degrees else 0
-        max_degree_node = max(degrees.items(), key=lambda x: x[1]) if degrees else (None, 0)
+        num_nodes = self.network.number_of_nodes()
+        avg_degree = 2 * self.network.number_of_edges() / num_nodes if num_nodes else 0
+        if num_stops:
+            most_connected = self.degree.argmax()
+            max_degree_node = (self.stop_ids[most_connected], self.degree[most_connected])
+        else:
+            max_degree_node = (None, 0)
         
         print(f"\nNetwork Build Details:")
         print(f"  Average connections per stop: {avg_degree:.2f}")
         print(f"  Most connected stop: {max_degree_node[0]} ({max_degree_node[1]} connections)")
-        print(f"  Total trips processed: {len(trips_data)}")
+        print(f"  Total trips processed: {self.stop_times['trip_id'].nunique()}")
         
         # Show capacity distribution
         capacities = [d['capacity'] for u, v, d in self.network.edges(data=True)]
@@ -104,7 +203,7 @@ class TransjakartaMaxFlowAnalyzer:
     
     def analyze_max_flow(self, source_stop, sink_stop):
         """
-        Run Ford-Fulkerson maximum flow algorithm
+        Run Dinic's maximum flow algorithm (scipy.sparse.csgraph)
         
         Args:
             source_stop: Starting stop ID
@@ -125,12 +224,22 @@ class TransjakartaMaxFlowAnalyzer:
         start_time = time.time()
         
         # Run maximum flow algorithm
-        flow_value, flow_dict = maximum_flow(
-            self.network, 
-            source_stop, 
-            sink_stop,
-            capacity='capacity'
+        result = maximum_flow(
+            self.capacity_matrix,
+            self.stop_ids.get_loc(source_stop),
+            self.stop_ids.get_loc(sink_stop),
+            method='dinic'
         )
+        flow_value = int(result.flow_value)
+        
+        # Same {u: {v: flow}} layout networkx returns, covering every edge
+        edge_flows = np.asarray(
+            result.flow[self.edges['u'].to_numpy(), self.edges['v'].to_numpy()]
+        ).ravel()
+        flow_dict = {u: dict.fromkeys(self.network[u], 0) for u in self.network}
+        for u, v, flow in zip(self.edges['stop_id'], self.edges['next_stop'], edge_flows):
+            if flow > 0:
+                flow_dict[u][v] = int(flow)
         
         elapsed_time = time.time() - start_time
         
@@ -205,12 +314,16 @@ class TransjakartaMaxFlowAnalyzer:
         
         return bottlenecks
     
-    def analyze_all_pairs_flow(self, top_stops=10):
+    def analyze_all_pairs_flow(self, top_stops=10, max_workers=None, min_parallel_pairs=20):
         """
         Analyze flow between top stops (by degree)
         
         Args:
             top_stops: Number of top connected stops to analyze
+            max_workers: Worker processes for the pairs (default: CPU count)
+            min_parallel_pairs: Smaller batches run in this process; a pair
+                takes ~3 ms and each worker ~10 ms to start, so with 4
+                workers the pool pays off from about 20 pairs
         
         Returns:
             DataFrame with flow analysis results
@@ -219,32 +332,50 @@ class TransjakartaMaxFlowAnalyzer:
             raise ValueError("Network not built. Call build_network() first.")
         
         # Find top stops by degree (most connected)
-        degrees = dict(self.network.degree())
-        top_stop_ids = sorted(degrees.items(), key=lambda x: x[1], reverse=True)[:top_stops]
+        top_indices = _top_k(self.degree, top_stops).tolist()
         
         print(f"\nAnalyzing max flow between top {top_stops} connected stops...")
         
+        # Every pair is independent, so large batches go to worker processes
+        pairs = [
+            (source, sink)
+            for source in top_indices
+            for sink in top_indices
+            if source != sink
+        ]
+        start_time = time.time()
+        
+        workers = max_workers or os.cpu_count() or 1
+        if len(pairs) < min_parallel_pairs or workers == 1:
+            pair_flows = [
+                (source, sink, _max_flow_value(self.capacity_matrix, source, sink))
+                for source, sink in pairs
+            ]
+        else:
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_flow_worker,
+                initargs=(self.capacity_matrix,)
+            ) as executor:
+                pair_flows = list(executor.map(_pair_max_flow, pairs))
+        
+        print(f"✓ Computed {len(pairs)} pairs in {time.time() - start_time:.4f} seconds")
+        
         results = []
-        total_pairs = len(top_stop_ids) * (len(top_stop_ids) - 1)
-        count = 0
-        
-        for i, (source, _) in enumerate(top_stop_ids):
-            for j, (sink, _) in enumerate(top_stop_ids):
-                if source != sink:
-                    count += 1
-                    try:
-                        flow_val, _ = self.analyze_max_flow(source, sink)
-                        results.append({
-                            'source': source,
-                            'sink': sink,
-                            'max_flow': flow_val,
-                            'source_name': self.network.nodes[source].get('stop_name', source),
-                            'sink_name': self.network.nodes[sink].get('stop_name', sink)
-                        })
-                    except:
-                        pass  # No path exists
-        
-        df = pd.DataFrame(results)
+        for source_idx, sink_idx, flow_val in pair_flows:
+            if flow_val is None:
+                continue  # No path exists
+            source = self.stop_ids[source_idx]
+            sink = self.stop_ids[sink_idx]
+            results.append({
+                'source': source,
+                'sink': sink,
+                'max_flow': flow_val,
+                'source_name': self.network.nodes[source].get('stop_name', source),
+                'sink_name': self.network.nodes[sink].get('stop_name', sink)
+            })
+        
+        df = pd.DataFrame(results, columns=['source', 'sink', 'max_flow', 'source_name', 'sink_name'])
         return df.sort_values('max_flow', ascending=False)
     
     def add_passenger_demand(self, demand_data):
@@ -329,21 +460,18 @@ class TransjakartaMaxFlowAnalyzer:
         print(f"  Min capacity: {min(capacities):,}")
         
         # Node degree analysis
-        in_degrees = dict(self.network.in_degree())
-        out_degrees = dict(self.network.out_degree())
-        
         print(f"\nNode Degree Statistics:")
-        print(f"  Average in-degree: {sum(in_degrees.values())/len(in_degrees):.2f}")
-        print(f"  Average out-degree: {sum(out_degrees.values())/len(out_degrees):.2f}")
+        print(f"  Average in-degree: {self.in_degree.mean():.2f}")
+        print(f"  Average out-degree: {self.out_degree.mean():.2f}")
         
         # Find hubs (high degree nodes)
-        total_degrees = {k: in_degrees[k] + out_degrees[k] for k in in_degrees}
-        top_hubs = sorted(total_degrees.items(), key=lambda x: x[1], reverse=True)[:5]
+        top_hubs = _top_k(self.degree, 5)
         
         print(f"\nTop 5 Hub Stops (Most Connected):")
-        for i, (stop, degree) in enumerate(top_hubs, 1):
+        for i, idx in enumerate(top_hubs, 1):
+            stop = self.stop_ids[idx]
             stop_name = self.network.nodes[stop].get('stop_name', stop)
-            print(f"  {i}. {stop_name}: {degree} connections ({in_degrees[stop]} in, {out_degrees[stop]} out)")
+            print(f"  {i}. {stop_name}: {self.degree[idx]} connections ({self.in_degree[idx]} in, {self.out_degree[idx]} out)")
         
         # Route analysis
         print(f"\nRoute Information:")
@@ -372,15 +500,20 @@ if __name__ == "__main__":
     print("="*80)
     
     # Get stops sorted by degree (most connected)
-    degrees = dict(analyzer.network.degree())
-    top_stops = sorted(degrees.items(), key=lambda x: x[1], reverse=True)[:20]
+    top_stops = [
+        (analyzer.stop_ids[idx], int(analyzer.degree[idx]))
+        for idx in _top_k(analyzer.degree, 20)
+    ]
+    
+    # Index stops once so each lookup is a hash hit, not a column scan
+    stops_by_id = analyzer.stops.drop_duplicates('stop_id').set_index('stop_id')
     
     for i, (stop_id, degree) in enumerate(top_stops, 1):
-        stop_info = analyzer.stops[analyzer.stops['stop_id'] == stop_id]
-        if not stop_info.empty:
-            stop_name = stop_info.iloc[0].get('stop_name', 'N/A')
-            lat = stop_info.iloc[0].get('stop_lat', 'N/A')
-            lon = stop_info.iloc[0].get('stop_lon', 'N/A')
+        if stop_id in stops_by_id.index:
+            stop_info = stops_by_id.loc[stop_id]
+            stop_name = stop_info.get('stop_name', 'N/A')
+            lat = stop_info.get('stop_lat', 'N/A')
+            lon = stop_info.get('stop_lon', 'N/A')
             print(f"{i:2d}. ID: {stop_id:20s} | {stop_name:40s} | Connections: {degree:3d} | Coords: ({lat}, {lon})")
     
     # Example: Analyze max flow between most connected stops